@@ -0,0 +1,510 @@
+"""
+SQLite record store for EduConnect.
+
+Student records, attendance, grades, exams, fee payments, notices and
+cafeteria orders live here so every admin write touches only the rows it
+changes. Catalog data (timetable, menu, placements, events, faculty) stays
+in student_data.json.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import orjson
+
+BASE = os.path.dirname(__file__)
+DB_FILE = os.path.join(BASE, "educonnect.db")
+
+# Top-level sections of DATA that are owned by the database
+RECORD_SECTIONS = ("students", "notices")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    key TEXT PRIMARY KEY,
+    json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    student_key TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    present INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    percent INTEGER NOT NULL,
+    PRIMARY KEY (student_key, subject)
+);
+CREATE TABLE IF NOT EXISTS grades (
+    student_key TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    marks INTEGER NOT NULL,
+    credits INTEGER NOT NULL,
+    PRIMARY KEY (student_key, subject)
+);
+CREATE TABLE IF NOT EXISTS exams (
+    id INTEGER PRIMARY KEY,
+    student_key TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    date TEXT,
+    time TEXT,
+    venue TEXT,
+    type TEXT,
+    days_left INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_exams_student ON exams(student_key, subject);
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_key TEXT NOT NULL,
+    date TEXT,
+    amount INTEGER NOT NULL,
+    mode TEXT,
+    receipt TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payments_student ON payments(student_key);
+CREATE TABLE IF NOT EXISTS notices (
+    id INTEGER NOT NULL UNIQUE,
+    title TEXT,
+    content TEXT,
+    type TEXT,
+    date TEXT,
+    author TEXT,
+    time_ago TEXT
+);
+CREATE TABLE IF NOT EXISTS cafeteria_orders (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    student_key TEXT NOT NULL,
+    items TEXT NOT NULL,
+    total INTEGER,
+    status TEXT,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_student ON cafeteria_orders(student_key);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON cafeteria_orders(status);
+
+-- Full-text index over notices, kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS notices_fts USING fts5(title, content, content='notices');
+CREATE TRIGGER IF NOT EXISTS notices_ai AFTER INSERT ON notices BEGIN
+    INSERT INTO notices_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS notices_ad AFTER DELETE ON notices BEGIN
+    INSERT INTO notices_fts(notices_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+END;
+"""
+
+SCHEMA_VERSION = 1
+
+
+def connect(path=DB_FILE):
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+conn = connect()
+_lock = threading.RLock()
+# Transactions committed through conn
+_commits = 0
+
+
+@contextmanager
+def transaction():
+    """Run a block of statements as one atomic write."""
+    global _commits
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        _commits += 1
+
+
+def external_version():
+    """PRAGMA data_version: moves only when another connection (e.g. another
+    worker) commits"""
+    with _lock:
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def data_version():
+    """A value that changes whenever the stored records do"""
+    return external_version(), _commits
+
+
+# =============================================
+# SERIALIZATION HELPERS
+# =============================================
+
+def _dumps(value):
+    return orjson.dumps(value).decode()
+
+
+def _blob(student):
+    """Student record without the collections that have their own tables.
+
+    The collections are kept as empty placeholders so the key order of the
+    record survives a round trip through the database.
+    """
+    blob = dict(student)
+    blob["attendance"] = {**student["attendance"], "subjects": {}}
+    blob["grades"] = {**student["grades"], "current_semester": {}}
+    blob["fees"] = {**student["fees"], "payment_history": []}
+    blob["exams"] = []
+    if "cafeteria_orders" in student:
+        blob["cafeteria_orders"] = []
+    return _dumps(blob)
+
+
+def _summary(section, collection):
+    """Aggregate fields of a student section, without its row collection."""
+    return _dumps({k: v for k, v in section.items() if k != collection})
+
+
+def _set_summary(cur, key, path, summary):
+    cur.execute(
+        "UPDATE students SET json = json_patch(json, json_object(?, json(?))) WHERE key = ?",
+        (path, summary, key),
+    )
+
+
+def _insert_student(cur, key, student):
+    cur.execute(
+        "INSERT INTO students(key, json) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET json = excluded.json",
+        (key, _blob(student)),
+    )
+    cur.executemany(
+        "INSERT INTO attendance(student_key, subject, present, total, percent) VALUES (?, ?, ?, ?, ?)",
+        [(key, subj, a["present"], a["total"], a["percent"])
+         for subj, a in student["attendance"]["subjects"].items()],
+    )
+    cur.executemany(
+        "INSERT INTO grades(student_key, subject, grade, marks, credits) VALUES (?, ?, ?, ?, ?)",
+        [(key, subj, g["grade"], g["marks"], g["credits"])
+         for subj, g in student["grades"]["current_semester"].items()],
+    )
+    for exam in student["exams"]:
+        _insert_exam(cur, key, exam)
+    for payment in student["fees"]["payment_history"]:
+        _insert_payment(cur, key, payment)
+    # Orders are kept newest first, so insert oldest first to keep rowid order
+    for order in reversed(student.get("cafeteria_orders", [])):
+        _insert_order(cur, key, order)
+
+
+def _insert_exam(cur, key, exam):
+    cur.execute(
+        "INSERT INTO exams(student_key, subject, date, time, venue, type, days_left) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (key, exam["subject"], exam["date"], exam["time"], exam["venue"], exam["type"], exam["days_left"]),
+    )
+
+
+def _insert_payment(cur, key, payment):
+    cur.execute(
+        "INSERT INTO payments(student_key, date, amount, mode, receipt) VALUES (?, ?, ?, ?, ?)",
+        (key, payment["date"], payment["amount"], payment["mode"], payment["receipt"]),
+    )
+
+
+def _insert_order(cur, key, order):
+    return cur.execute(
+        "INSERT INTO cafeteria_orders(id, student_key, items, total, status, date) VALUES (?, ?, ?, ?, ?, ?)",
+        (order["id"], key, _dumps(order["items"]), order["total"], order["status"], order["date"]),
+    ).lastrowid
+
+
+def _insert_notice(cur, notice):
+    cur.execute(
+        "INSERT INTO notices(id, title, content, type, date, author, time_ago) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (notice["id"], notice["title"], notice["content"], notice["type"],
+         notice["date"], notice["author"], notice["time_ago"]),
+    )
+
+
+# =============================================
+# LOADING / MIGRATION
+# =============================================
+
+def init(seed):
+    """Import students and notices from the JSON seed into a fresh database."""
+    with transaction() as cur:
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            for key, student in seed.get("students", {}).items():
+                _insert_student(cur, key, student)
+            # Notices are kept newest first, so insert oldest first
+            for notice in reversed(seed.get("notices", [])):
+                _insert_notice(cur, notice)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def load_records():
+    """Rebuild the students and notices sections of DATA from the database."""
+    with _lock:
+        students = {row["key"]: orjson.loads(row["json"])
+                    for row in conn.execute("SELECT key, json FROM students ORDER BY rowid")}
+
+        # Subject names repeat across students: intern them so every record
+        # shares one string per subject
+        for row in conn.execute("SELECT * FROM attendance ORDER BY rowid"):
+            if row["student_key"] in students:
+                students[row["student_key"]]["attendance"]["subjects"][sys.intern(row["subject"])] = {
+                    "present": row["present"], "total": row["total"], "percent": row["percent"]}
+
+        for row in conn.execute("SELECT * FROM grades ORDER BY rowid"):
+            if row["student_key"] in students:
+                students[row["student_key"]]["grades"]["current_semester"][sys.intern(row["subject"])] = {
+                    "grade": row["grade"], "credits": row["credits"], "marks": row["marks"]}
+
+        for row in conn.execute("SELECT * FROM exams ORDER BY id"):
+            if row["student_key"] in students:
+                students[row["student_key"]]["exams"].append({
+                    "subject": row["subject"], "date": row["date"], "time": row["time"],
+                    "venue": row["venue"], "type": row["type"], "days_left": row["days_left"]})
+
+        for row in conn.execute("SELECT * FROM payments ORDER BY id"):
+            if row["student_key"] in students:
+                students[row["student_key"]]["fees"]["payment_history"].append({
+                    "date": row["date"], "amount": row["amount"], "mode": row["mode"],
+                    "receipt": row["receipt"]})
+
+        for row in conn.execute("SELECT * FROM cafeteria_orders ORDER BY rowid DESC"):
+            if row["student_key"] in students:
+                students[row["student_key"]].setdefault("cafeteria_orders", []).append({
+                    "id": row["id"], "items": orjson.loads(row["items"]), "total": row["total"],
+                    "status": row["status"], "date": row["date"]})
+
+        # Keyed by id so deletes are O(1); oldest first, so iterate reversed for newest
+        notices = {row["id"]: dict(row) for row in conn.execute(
+            "SELECT id, title, content, type, date, author, time_ago FROM notices ORDER BY rowid")}
+
+    return {"students": students, "notices": notices}
+
+
+# =============================================
+# STUDENTS
+# =============================================
+
+def save_student(key, student):
+    """Write a student's own record (profile, library, courses, appointments)."""
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO students(key, json) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET json = excluded.json",
+            (key, _blob(student)),
+        )
+
+
+def delete_student(key):
+    with transaction() as cur:
+        for table in ("attendance", "grades", "exams", "payments", "cafeteria_orders"):
+            cur.execute(f"DELETE FROM {table} WHERE student_key = ?", (key,))
+        cur.execute("DELETE FROM students WHERE key = ?", (key,))
+
+
+# =============================================
+# ATTENDANCE / GRADES / EXAMS
+# =============================================
+
+_UPSERT_ATTENDANCE = (
+    "INSERT INTO attendance(student_key, subject, present, total, percent) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(student_key, subject) DO UPDATE SET "
+    "present = excluded.present, total = excluded.total, percent = excluded.percent"
+)
+
+_UPSERT_GRADE = (
+    "INSERT INTO grades(student_key, subject, grade, marks, credits) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(student_key, subject) DO UPDATE SET "
+    "grade = excluded.grade, marks = excluded.marks, credits = excluded.credits"
+)
+
+
+def upsert_attendance(key, subject, row, attendance):
+    upsert_attendance_many([(key, subject, row)], {key: attendance})
+
+
+def upsert_attendance_many(rows, summaries):
+    """Write (student_key, subject, row) attendance entries and the updated
+    per-student summaries in a single transaction."""
+    with transaction() as cur:
+        cur.executemany(_UPSERT_ATTENDANCE, [
+            (key, subject, row["present"], row["total"], row["percent"])
+            for key, subject, row in rows])
+        for key, attendance in summaries.items():
+            _set_summary(cur, key, "attendance", _summary(attendance, "subjects"))
+
+
+def delete_attendance(key, subject, attendance):
+    with transaction() as cur:
+        cur.execute("DELETE FROM attendance WHERE student_key = ? AND subject = ?", (key, subject))
+        _set_summary(cur, key, "attendance", _summary(attendance, "subjects"))
+
+
+def upsert_grade(key, subject, row, grades):
+    upsert_grade_many([(key, subject, row)], {key: grades})
+
+
+def upsert_grade_many(rows, summaries):
+    """Write (student_key, subject, row) grade entries and the updated
+    per-student summaries in a single transaction."""
+    with transaction() as cur:
+        cur.executemany(_UPSERT_GRADE, [
+            (key, subject, row["grade"], row["marks"], row["credits"])
+            for key, subject, row in rows])
+        for key, grades in summaries.items():
+            _set_summary(cur, key, "grades", _summary(grades, "current_semester"))
+
+
+def delete_grade(key, subject, grades):
+    with transaction() as cur:
+        cur.execute("DELETE FROM grades WHERE student_key = ? AND subject = ?", (key, subject))
+        _set_summary(cur, key, "grades", _summary(grades, "current_semester"))
+
+
+def add_exam(key, exam):
+    add_exams([(key, exam)])
+
+
+def add_exams(entries):
+    """Insert (student_key, exam) entries in a single transaction."""
+    with transaction() as cur:
+        for key, exam in entries:
+            _insert_exam(cur, key, exam)
+
+
+def delete_exams(key, subject):
+    with transaction() as cur:
+        cur.execute("DELETE FROM exams WHERE student_key = ? AND subject = ?", (key, subject))
+
+
+# =============================================
+# FEES
+# =============================================
+
+def update_fees(key, fees):
+    with transaction() as cur:
+        _set_summary(cur, key, "fees", _summary(fees, "payment_history"))
+
+
+def add_payment(key, payment, fees):
+    """Record a payment and return its receipt number.
+
+    Receipts are numbered from the AUTOINCREMENT id, so concurrent payments
+    always get distinct, increasing receipts.
+    """
+    with transaction() as cur:
+        payment_id = cur.execute(
+            "INSERT INTO payments(student_key, date, amount, mode) VALUES (?, ?, ?, ?)",
+            (key, payment["date"], payment["amount"], payment["mode"]),
+        ).lastrowid
+        receipt = f"REC{payment_id:03d}"
+        cur.execute("UPDATE payments SET receipt = ? WHERE id = ?", (receipt, payment_id))
+        _set_summary(cur, key, "fees", _summary(fees, "payment_history"))
+    return receipt
+
+
+# =============================================
+# NOTICES
+# =============================================
+
+def add_notice(notice):
+    """Insert a notice and return its id.
+
+    The id is allocated inside the insert transaction, so concurrent
+    notices never race for the same one.
+    """
+    with transaction() as cur:
+        notice_id = cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM notices").fetchone()[0]
+        _insert_notice(cur, {**notice, "id": notice_id})
+    return notice_id
+
+
+def delete_notice(notice_id):
+    with transaction() as cur:
+        cur.execute("DELETE FROM notices WHERE id = ?", (notice_id,))
+
+
+def search_notices(query, limit=20):
+    """Full-text search over notice titles and content, best match first."""
+    # Quote every term so user input is never parsed as FTS5 syntax
+    terms = " ".join('"' + t.replace('"', '""') + '"' for t in query.split())
+    if not terms:
+        return []
+    with _lock:
+        rows = conn.execute(
+            "SELECT n.id, n.title, n.content, n.type, n.date, n.author, n.time_ago "
+            "FROM notices_fts JOIN notices n ON n.rowid = notices_fts.rowid "
+            "WHERE notices_fts MATCH ? ORDER BY rank LIMIT ?",
+            (terms, limit),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+# =============================================
+# CAFETERIA ORDERS
+# =============================================
+
+def add_order(key, order):
+    """Record an order and return its id.
+
+    Ids are numbered from the AUTOINCREMENT seq, like payment receipts, so
+    no two orders share one. The five-digit width keeps them apart from the
+    shorter ids of seeded orders.
+    """
+    with transaction() as cur:
+        seq = _insert_order(cur, key, {**order, "id": None})
+        order_id = f"ORD{seq:05d}"
+        cur.execute("UPDATE cafeteria_orders SET id = ? WHERE seq = ?", (order_id, seq))
+    return order_id
+
+
+def iter_orders(status=None, batch_size=256):
+    """Yield every student's orders (with the student's name), newest first,
+    in lists of up to batch_size.
+
+    Uses its own connection so a slow consumer never holds the shared
+    connection's lock; under WAL the reader does not block writers.
+    """
+    sql = ("SELECT o.id, o.items, o.total, o.status, o.date, o.student_key, "
+           "json_extract(s.json, '$.name') AS student_name "
+           "FROM cafeteria_orders o JOIN students s ON s.key = o.student_key")
+    params = ()
+    if status:
+        sql += " WHERE o.status = ?"
+        params = (status,)
+
+    # Batches may be pulled from different worker threads
+    reader = sqlite3.connect(DB_FILE, check_same_thread=False)
+    reader.row_factory = sqlite3.Row
+    try:
+        cur = reader.execute(sql + " ORDER BY o.rowid DESC", params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                order = dict(row)
+                order["items"] = orjson.loads(order["items"])
+                batch.append(order)
+            yield batch
+    finally:
+        reader.close()
+
+
+def update_order_status(key, order_id, status):
+    """Set an order's status; returns False if the order does not exist."""
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE cafeteria_orders SET status = ? WHERE id = ? AND student_key = ?",
+            (status, order_id, key),
+        )
+        return cur.execute("SELECT changes()").fetchone()[0] > 0
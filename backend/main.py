@@ -1,56 +1,214 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-import json
+from typing import Optional, List, Dict, Any, Tuple, Annotated
+import orjson
+import logging
 import re
 import os
 import secrets
-from datetime import datetime
+import asyncio
+import threading
+import time
+import bcrypt
+import jwt
+from collections import Counter, deque
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from . import db
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="EduConnect API", version="3.0")
 
-# CORS (allow frontend requests)
+# Teacher/admin API, included into the app once all its routes are defined
+admin = APIRouter(prefix="/api/admin")
+
+# CORS: the bundled pages are served from this app and need none. List any
+# separately hosted frontends in EDUCONNECT_ORIGINS (comma separated);
+# browsers cache the preflight for a day
+CORS_ORIGINS = [o.strip() for o in os.environ.get("EDUCONNECT_ORIGINS", "").split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,
 )
 
+# Compress JSON and page responses over 1 KB; added last so it is the
+# outermost middleware and sees the final body
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Constants
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
 
+# Static Files (CSS, JS, Images); also serves the HTML pages below so they
+# get ETag/Last-Modified and answer conditional requests with 304
+static_files = StaticFiles(directory=FRONTEND_DIR)
+PAGE_CACHE_CONTROL = "public, max-age=60"
+
+async def serve_page(name: str, request: Request) -> Response:
+    response = await static_files.get_response(name, request.scope)
+    response.headers["Cache-Control"] = PAGE_CACHE_CONTROL
+    return response
+
 # Serve Index (Catch-all for root)
 @app.get("/")
-async def read_index():
-    return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
+async def read_index(request: Request):
+    return await serve_page("index.html", request)
 
 # Serve Admin
 @app.get("/admin")
-async def read_admin():
-    return FileResponse(os.path.join(FRONTEND_DIR, "admin.html"))
+async def read_admin(request: Request):
+    return await serve_page("admin.html", request)
 
-# Mount Static Files (CSS, JS, Images)
-app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
+# Mount Static Files
+app.mount("/static", static_files, name="static")
 
 
-# Load JSON database
+# Load database: catalog data (timetable, menu, placements, ...) lives in
+# JSON, student records and notices live in SQLite (see db.py).
+# student_data.json is the tracked seed and is never written; catalog edits
+# are saved to their own file, which overrides the seed's catalog sections.
 BASE = os.path.dirname(__file__)
 DATA_FILE = os.path.join(BASE, "student_data.json")
-
-def load_data():
-    with open(DATA_FILE, encoding="utf-8") as f:
-        return json.load(f)
+CATALOG_FILE = os.path.join(BASE, "catalog.json")
+
+def read_json():
+    with open(DATA_FILE, "rb") as f:
+        data = orjson.loads(f.read())
+    try:
+        with open(CATALOG_FILE, "rb") as f:
+            data.update(orjson.loads(f.read()))
+    except FileNotFoundError:
+        pass
+    return data
+
+def reload_records():
+    """Refresh the students and notices sections from the database if
+    another connection has written to it since they were loaded.
+
+    Writes made here already update DATA, so only outside commits count.
+    The catalog sections are only ever written by this process, so they are
+    not re-read: that would drop edits still waiting for the flusher.
+    """
+    global _records_version
+    with _reload_lock:
+        version = db.external_version()
+        if version == _records_version:
+            return
+        DATA.update(db.load_records())
+        _records_version = version
+        index_students()
+        students_changed()
+        records_changed()
+
+_reload_lock = threading.Lock()
 
 def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-DATA = load_data()
+    """Write the catalog sections to the catalog file.
+
+    The file is written to a temporary sibling, fsynced and swapped in with
+    os.replace, so a crash mid-write never leaves a truncated database.
+    """
+    catalog = {k: v for k, v in data.items() if k not in db.RECORD_SECTIONS}
+    tmp = CATALOG_FILE + ".tmp"
+    with _save_lock:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(catalog, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, CATALOG_FILE)
+
+_save_lock = threading.Lock()
+
+# Parse the JSON files once at startup: the seed fills a fresh database and
+# the seed or saved catalog provides the catalog sections
+DATA = read_json()
+db.init(DATA)
+_records_version = db.external_version()
+DATA.update(db.load_records())
+
+# Lower-cased name -> stored key, so lookups are case-insensitive
+STUDENT_INDEX: Dict[str, str] = {}
+
+def index_students():
+    STUDENT_INDEX.clear()
+    STUDENT_INDEX.update({k.lower(): k for k in DATA["students"]})
+
+index_students()
+
+
+# Catalog writes are coalesced: endpoints mark the data dirty and a
+# background task saves it once things have been quiet for FLUSH_DELAY
+FLUSH_DELAY = 0.5
+# Wait before retrying a save that failed (disk full, permissions, ...)
+FLUSH_RETRY = 5.0
+_dirty: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_flush_task: Optional[asyncio.Task] = None
+
+# Bumped on every catalog edit; part of data_version()
+_catalog_version = 0
+
+def mark_dirty():
+    """Schedule a background save of the JSON catalog"""
+    global _catalog_version
+    _catalog_version += 1
+    if _loop is None:
+        # App not started (e.g. imported by a script): save right away
+        save_data(DATA)
+        return
+    _loop.call_soon_threadsafe(_dirty.set)
+
+# Bumped once DATA holds a record change whose commit came first (database
+# allocated ids, reloads); part of data_version(). Replies are built from
+# DATA, so a reply rendered between the commit and the DATA update must not
+# be cached under the final version.
+_records_edits = 0
+_records_edits_lock = threading.Lock()
+
+def records_changed():
+    """Call after updating DATA for a change that was already committed"""
+    global _records_edits
+    with _records_edits_lock:
+        _records_edits += 1
+
+async def _flusher():
+    while True:
+        await _dirty.wait()
+        await asyncio.sleep(FLUSH_DELAY)
+        _dirty.clear()
+        try:
+            await asyncio.to_thread(save_data, DATA)
+        except Exception:
+            # Keep the task alive and the edits pending for the next pass
+            logger.exception("Saving the catalog failed; retrying in %.0fs", FLUSH_RETRY)
+            _dirty.set()
+            await asyncio.sleep(FLUSH_RETRY)
+
+@app.on_event("startup")
+async def start_flusher():
+    global _dirty, _loop, _flush_task
+    _dirty = asyncio.Event()
+    _loop = asyncio.get_running_loop()
+    _flush_task = asyncio.create_task(_flusher())
+
+@app.on_event("shutdown")
+async def stop_flusher():
+    global _loop
+    _flush_task.cancel()
+    _loop = None
+    if _dirty.is_set():
+        await asyncio.to_thread(save_data, DATA)
 
 
 # =============================================
@@ -96,6 +254,15 @@ class ExamUpdate(BaseModel):
     exam_type: str
     days_left: int
 
+class AttendanceBulk(BaseModel):
+    items: List[AttendanceUpdate]
+
+class GradeBulk(BaseModel):
+    items: List[GradeUpdate]
+
+class ExamBulk(BaseModel):
+    items: List[ExamUpdate]
+
 class FeeUpdate(BaseModel):
     student_key: str
     total_fee: int
@@ -169,48 +336,130 @@ class AdminLogin(BaseModel):
 # ADMIN AUTHENTICATION
 # =============================================
 
-# Admin credentials (In production, use hashed passwords and proper auth)
-ADMIN_CREDENTIALS = {
-    "admin": "admin123"
+# Admin password hashes, generated offline with
+# bcrypt.hashpw(password, bcrypt.gensalt(12)). The demo password for
+# "admin" is "admin123": replace the hash before deploying.
+ADMIN_HASHES = {
+    "admin": b"$2b$12$6HtvLZFAZx9bklTk6yCRpOtdH4CRKttj63OxzgxeBtnXaKJZzBWV6"
 }
 
-# Active sessions (in-memory, for demo purposes)
-admin_sessions = {}
-
-@app.post("/api/admin/login")
-def admin_login(credentials: AdminLogin):
+# Checked for unknown usernames so they cost the same as a wrong password
+_DUMMY_HASH = b"$2b$12$9fKVpT.JeZ7JfucTzD4Y8.Gya6Exjhhx5vfFGBYdP8nT2Szfgz1e6"
+
+def check_password(username: str, password: str) -> bool:
+    """Constant-time check of an admin password against its bcrypt hash"""
+    hashed = ADMIN_HASHES.get(username)
+    # bcrypt only looks at the first 72 bytes
+    matches = bcrypt.checkpw(password.encode()[:72], hashed or _DUMMY_HASH)
+    return matches and hashed is not None
+
+# bcrypt is CPU-bound (~0.25 s per check): run it in its own pool so a login
+# flood cannot tie up the threadpool that serves every other endpoint, and
+# cap how many checks run at once
+HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(4)
+
+# Failed logins per (client IP, username); once LOGIN_MAX_FAILURES land
+# within LOGIN_WINDOW seconds, further attempts are refused before hashing.
+# Behind the platform router every client shares the router's IP, so the
+# username is part of the key: guessing one name never locks out another.
+LOGIN_MAX_FAILURES = 5
+LOGIN_WINDOW = 60.0
+failed_logins: Dict[Tuple[str, str], deque] = {}
+_login_lock = threading.Lock()
+
+def login_blocked(client: Tuple[str, str]) -> bool:
+    with _login_lock:
+        attempts = failed_logins.get(client)
+        if not attempts:
+            return False
+        cutoff = time.monotonic() - LOGIN_WINDOW
+        while attempts and attempts[0] < cutoff:
+            attempts.popleft()
+        if not attempts:
+            del failed_logins[client]
+            return False
+        return len(attempts) >= LOGIN_MAX_FAILURES
+
+def record_failed_login(client: Tuple[str, str]):
+    with _login_lock:
+        now = time.monotonic()
+        failed_logins.setdefault(client, deque()).append(now)
+        if len(failed_logins) > 10000:
+            # Forget clients whose last failure is outside the window
+            for k in [k for k, a in failed_logins.items() if a[-1] < now - LOGIN_WINDOW]:
+                del failed_logins[k]
+
+# Sessions are signed, expiring JWTs, so no server-side session state is
+# kept. Set EDUCONNECT_SECRET so all workers (and restarts) share the key.
+JWT_SECRET = os.environ.get("EDUCONNECT_SECRET") or secrets.token_hex(32)
+JWT_ALGORITHM = "HS256"
+TOKEN_TTL = timedelta(hours=8)
+
+# Logged-out token ids -> expiry timestamp, dropped once expired
+revoked_tokens: Dict[str, float] = {}
+# Logouts run in the threadpool and prune while they insert
+_revoked_lock = threading.Lock()
+
+def decode_admin_token(token: str) -> Optional[Dict[str, Any]]:
+    """Claims of a valid, unexpired, not revoked admin token (else None)"""
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    if payload.get("jti") in revoked_tokens:
+        return None
+    return payload
+
+@admin.post("/login")
+async def admin_login(credentials: AdminLogin, request: Request):
     """Admin login endpoint"""
-    if credentials.username in ADMIN_CREDENTIALS:
-        if ADMIN_CREDENTIALS[credentials.username] == credentials.password:
-            # Generate a simple session token
-            token = secrets.token_hex(16)
-            admin_sessions[token] = {
-                "username": credentials.username,
-                "login_time": datetime.now().isoformat()
-            }
-            return {
-                "success": True,
-                "message": "Login successful",
-                "token": token,
-                "username": credentials.username
-            }
+    client = (request.client.host if request.client else "unknown", credentials.username)
+    if login_blocked(client):
+        raise HTTPException(status_code=429, detail="Too many failed login attempts, try again later")
+    
+    async with _hash_slots:
+        valid = await asyncio.get_running_loop().run_in_executor(
+            HASH_POOL, check_password, credentials.username, credentials.password)
     
+    if valid:
+        now = datetime.now(timezone.utc)
+        token = jwt.encode({
+            "sub": credentials.username,
+            "jti": secrets.token_hex(8),
+            "iat": now,
+            "exp": now + TOKEN_TTL
+        }, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        return {
+            "success": True,
+            "message": "Login successful",
+            "token": token,
+            "username": credentials.username
+        }
+    
+    record_failed_login(client)
     raise HTTPException(status_code=401, detail="Invalid username or password")
 
 
-@app.post("/api/admin/logout")
+@admin.post("/logout")
 def admin_logout(token: str = ""):
     """Admin logout endpoint"""
-    if token in admin_sessions:
-        del admin_sessions[token]
+    payload = decode_admin_token(token)
+    if payload:
+        now = time.time()
+        with _revoked_lock:
+            for jti in [j for j, exp in revoked_tokens.items() if exp < now]:
+                del revoked_tokens[jti]
+            revoked_tokens[payload["jti"]] = payload["exp"]
     return {"success": True, "message": "Logged out successfully"}
 
 
-@app.get("/api/admin/verify")
-def verify_admin(token: str = ""):
+@admin.get("/verify")
+async def verify_admin(token: str = ""):
     """Verify admin session"""
-    if token in admin_sessions:
-        return {"valid": True, "username": admin_sessions[token]["username"]}
+    payload = decode_admin_token(token)
+    if payload:
+        return {"valid": True, "username": payload["sub"]}
     return {"valid": False}
 
 
@@ -218,11 +467,66 @@ def verify_admin(token: str = ""):
 # TEACHER ADMIN ENDPOINTS
 # =============================================
 
+def find_student_key(student_key: str) -> Optional[str]:
+    """Stored key for a student, matched case-insensitively (None if unknown)"""
+    if student_key in DATA["students"]:
+        return student_key
+    return STUDENT_INDEX.get(student_key.lower())
+
+
+def resolve_student(student_key: str):
+    """Return (key, record) for a student or raise 404"""
+    key = find_student_key(student_key)
+    if key is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return key, DATA["students"][key]
+
+
+async def student_dep(student_key: str):
+    """Dependency resolving the student_key path parameter to (key, record)"""
+    return resolve_student(student_key)
+
+# (key, record) of the student named in the path, 404 if unknown
+StudentRef = Annotated[Tuple[str, Dict[str, Any]], Depends(student_dep)]
+
+
+# (date, display string, student id prefix), recomputed when the day changes
+_today: Tuple[Optional[date], str, str] = (None, "", "")
+
+def _current_day():
+    global _today
+    day = date.today()
+    if _today[0] != day:
+        _today = (day, day.strftime("%d %b %Y"), f"CSE{day.year}A")
+    return _today
+
+def today_str() -> str:
+    """Today's date as shown on payments, notices and orders"""
+    return _current_day()[1]
+
+def student_id_prefix() -> str:
+    """Prefix of new student ids, e.g. CSE2024A"""
+    return _current_day()[2]
+
+
 # --- STUDENTS CRUD ---
 
-@app.get("/api/admin/students")
-def get_all_students():
-    """Get list of all students"""
+# Encoded response of get_all_students with the generation it was built
+# at, rebuilt only after a change to the fields it lists
+_students_cache: Optional[Tuple[int, bytes]] = None
+# Bumped by students_changed(); mutators call it from worker threads
+_students_gen = 0
+_students_gen_lock = threading.Lock()
+
+def students_changed():
+    """Invalidate the cached student list (call after any change to its fields)"""
+    global _students_gen
+    with _students_gen_lock:
+        _students_gen += 1
+
+
+def list_students():
+    """Summary row for every student, as shown in the admin list"""
     students = []
     for key, student in DATA["students"].items():
         students.append({
@@ -238,25 +542,50 @@ def get_all_students():
     return {"students": students, "total": len(students)}
 
 
-@app.get("/api/admin/student/{student_key}")
-def get_student(student_key: str):
+@admin.get("/students")
+async def get_all_students():
+    """Get list of all students"""
+    return Response(students_body(), media_type="application/json")
+
+
+def students_body() -> bytes:
+    global _students_cache
+    # Read the generation before building: a change made while the list is
+    # being built bumps it, so that snapshot can never be served from cache
+    gen = _students_gen
+    cache = _students_cache
+    if cache is not None and cache[0] == gen:
+        return cache[1]
+    body = orjson.dumps(list_students())
+    if gen == _students_gen:
+        _students_cache = (gen, body)
+    return body
+
+
+@app.on_event("startup")
+async def warm_caches():
+    """Encode the admin student list before the first request for it (the
+    data itself is parsed at import)"""
+    students_body()
+
+
+@admin.get("/student/{student_key}")
+async def get_student(ref: StudentRef) -> Dict[str, Any]:
     """Get complete details of a student"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    return {"student": DATA["students"][key], "key": key}
+    key, student = ref
+    return {"student": student, "key": key}
 
 
-@app.post("/api/admin/student")
+@admin.post("/student")
 def create_student(student: StudentBasic):
     """Add a new student"""
     key = student.name.lower()
-    if key in DATA["students"]:
+    if key in STUDENT_INDEX:
         raise HTTPException(status_code=400, detail="Student already exists")
     
     # Create complete student record
     DATA["students"][key] = {
-        "id": f"CSE{datetime.now().strftime('%Y')}A{len(DATA['students'])+1:02d}",
+        "id": f"{student_id_prefix()}{len(DATA['students'])+1:02d}",
         "name": student.name,
         "email": student.email,
         "phone": student.phone,
@@ -300,18 +629,18 @@ def create_student(student: StudentBasic):
         "courses": []
     }
     
-    save_data(DATA)
+    STUDENT_INDEX[key] = key
+    students_changed()
+    db.save_student(key, DATA["students"][key])
     return {"message": f"Student {student.name} added successfully", "key": key}
 
 
-@app.put("/api/admin/student/{student_key}")
-def update_student(student_key: str, student: StudentBasic):
+@admin.put("/student/{student_key}")
+def update_student(ref: StudentRef, student: StudentBasic):
     """Update student basic info"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, record = ref
     
-    DATA["students"][key].update({
+    record.update({
         "name": student.name,
         "email": student.email,
         "phone": student.phone,
@@ -325,200 +654,297 @@ def update_student(student_key: str, student: StudentBasic):
         "cgpa": student.cgpa
     })
     
-    save_data(DATA)
+    students_changed()
+    db.save_student(key, record)
     return {"message": f"Student {student.name} updated successfully"}
 
 
-@app.delete("/api/admin/student/{student_key}")
-def delete_student(student_key: str):
+@admin.delete("/student/{student_key}")
+def delete_student(ref: StudentRef):
     """Delete a student"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    name = DATA["students"][key]["name"]
+    name = student["name"]
     del DATA["students"][key]
-    save_data(DATA)
+    STUDENT_INDEX.pop(key.lower(), None)
+    students_changed()
+    db.delete_student(key)
     return {"message": f"Student {name} deleted successfully"}
 
+def require_students(keys):
+    """Raise 404 unless every student key exists (used by bulk endpoints)"""
+    missing = sorted({k for k in keys if find_student_key(k) is None})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Student not found: {', '.join(missing)}")
+
+
+def remove_where(items: List[Dict[str, Any]], field: str, value) -> int:
+    """Delete, in place, the entries whose field equals value; return how many went"""
+    removed = 0
+    for i in range(len(items) - 1, -1, -1):
+        if items[i][field] == value:
+            del items[i]
+            removed += 1
+    return removed
+
 
 # --- ATTENDANCE ---
 
-@app.post("/api/admin/attendance")
-def update_attendance(att: AttendanceUpdate):
-    """Update student attendance for a subject"""
-    key = att.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+def adjust_attendance(attendance, d_present, d_total):
+    """Apply a change in one subject's numbers to the overall attendance"""
+    attendance["present"] += d_present
+    attendance["total_classes"] += d_total
     
-    student = DATA["students"][key]
+    total_present = attendance["present"]
+    total_classes = attendance["total_classes"]
+    attendance["absent"] = total_classes - total_present
+    attendance["overall_percent"] = round((total_present / total_classes) * 100) if total_classes > 0 else 0
+
+
+def set_subject_attendance(student, att: AttendanceUpdate):
+    """Store one subject's attendance on a student and return the row"""
+    attendance = student["attendance"]
+    old = attendance["subjects"].get(att.subject)
     percent = round((att.present / att.total) * 100) if att.total > 0 else 0
     
-    student["attendance"]["subjects"][att.subject] = {
+    row = {
         "present": att.present,
         "total": att.total,
         "percent": percent
     }
+    attendance["subjects"][att.subject] = row
     
-    # Recalculate overall
-    subjects = student["attendance"]["subjects"]
-    total_present = sum(s["present"] for s in subjects.values())
-    total_classes = sum(s["total"] for s in subjects.values())
-    
-    student["attendance"]["present"] = total_present
-    student["attendance"]["total_classes"] = total_classes
-    student["attendance"]["absent"] = total_classes - total_present
-    student["attendance"]["overall_percent"] = round((total_present / total_classes) * 100) if total_classes > 0 else 0
+    # Update overall by the difference instead of re-summing every subject
+    adjust_attendance(
+        attendance,
+        att.present - (old["present"] if old else 0),
+        att.total - (old["total"] if old else 0),
+    )
+    return row
+
+
+@admin.post("/attendance")
+def update_attendance(att: AttendanceUpdate):
+    """Update student attendance for a subject"""
+    key, student = resolve_student(att.student_key)
+    row = set_subject_attendance(student, att)
+    students_changed()
     
-    save_data(DATA)
+    db.upsert_attendance(key, att.subject, row, student["attendance"])
     return {"message": f"Attendance updated for {att.subject}"}
 
 
-@app.delete("/api/admin/attendance/{student_key}/{subject}")
-def delete_attendance(student_key: str, subject: str):
+@admin.post("/attendance/bulk")
+def update_attendance_bulk(bulk: AttendanceBulk):
+    """Update attendance for many students/subjects in one transaction"""
+    require_students(att.student_key for att in bulk.items)
+    
+    rows = []
+    touched = {}
+    for att in bulk.items:
+        key, student = resolve_student(att.student_key)
+        rows.append((key, att.subject, set_subject_attendance(student, att)))
+        touched[key] = student["attendance"]
+    students_changed()
+    
+    db.upsert_attendance_many(rows, touched)
+    return {"message": f"Attendance updated for {len(rows)} entries"}
+
+
+@admin.delete("/attendance/{student_key}/{subject}")
+def delete_attendance(ref: StudentRef, subject: str):
     """Delete attendance for a subject"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    if subject in DATA["students"][key]["attendance"]["subjects"]:
-        del DATA["students"][key]["attendance"]["subjects"][subject]
-        save_data(DATA)
+    attendance = student["attendance"]
+    if subject in attendance["subjects"]:
+        old = attendance["subjects"].pop(subject)
+        adjust_attendance(attendance, -old["present"], -old["total"])
+        students_changed()
+        db.delete_attendance(key, subject, attendance)
     
     return {"message": f"Attendance deleted for {subject}"}
 
 
 # --- GRADES ---
 
-@app.post("/api/admin/grade")
-def update_grade(grade: GradeUpdate):
-    """Add/Update student grade for a subject"""
-    key = grade.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+# Grade points per letter grade (simplified scale)
+GRADE_POINTS = {"A+": 10, "A": 9, "A-": 8.5, "B+": 8, "B": 7, "B-": 6.5, "C+": 6, "C": 5, "D": 4, "F": 0}
+
+def grade_points(row):
+    """Grade points x credits for one subject"""
+    return GRADE_POINTS.get(row["grade"], 0) * row["credits"]
+
+
+def semester_totals(grades):
+    """Make sure the running SGPA totals exist (computed once for old records)"""
+    if "semester_points" not in grades:
+        rows = grades["current_semester"].values()
+        grades["semester_points"] = sum(grade_points(r) for r in rows)
+        grades["semester_credits"] = sum(r["credits"] for r in rows)
+    return grades
+
+
+def adjust_sgpa(grades, d_points, d_credits):
+    """Apply a change in one subject's grade to the running SGPA totals"""
+    grades["semester_points"] += d_points
+    grades["semester_credits"] += d_credits
     
-    student = DATA["students"][key]
-    student["grades"]["current_semester"][grade.subject] = {
+    total_credits = grades["semester_credits"]
+    grades["sgpa"] = round(grades["semester_points"] / total_credits, 2) if total_credits > 0 else 0
+    grades["earned_credits"] = total_credits
+
+
+def set_subject_grade(student, grade: GradeUpdate):
+    """Store one subject's grade on a student and return the row"""
+    grades = semester_totals(student["grades"])
+    old = grades["current_semester"].get(grade.subject)
+    row = {
         "grade": grade.grade,
         "marks": grade.marks,
         "credits": grade.credits
     }
+    grades["current_semester"][grade.subject] = row
     
-    # Recalculate SGPA (simplified)
-    grades_map = {"A+": 10, "A": 9, "A-": 8.5, "B+": 8, "B": 7, "B-": 6.5, "C+": 6, "C": 5, "D": 4, "F": 0}
-    total_points = 0
-    total_credits = 0
+    # Update SGPA by the difference instead of re-summing every subject
+    adjust_sgpa(
+        grades,
+        grade_points(row) - (grade_points(old) if old else 0),
+        row["credits"] - (old["credits"] if old else 0),
+    )
+    return row
+
+
+@admin.post("/grade")
+def update_grade(grade: GradeUpdate):
+    """Add/Update student grade for a subject"""
+    key, student = resolve_student(grade.student_key)
+    row = set_subject_grade(student, grade)
     
-    for subj, data in student["grades"]["current_semester"].items():
-        gp = grades_map.get(data["grade"], 0)
-        total_points += gp * data["credits"]
-        total_credits += data["credits"]
+    db.upsert_grade(key, grade.subject, row, student["grades"])
+    return {"message": f"Grade updated for {grade.subject}"}
+
+
+@admin.post("/grade/bulk")
+def update_grade_bulk(bulk: GradeBulk):
+    """Add/Update grades for many students/subjects in one transaction"""
+    require_students(grade.student_key for grade in bulk.items)
     
-    student["grades"]["sgpa"] = round(total_points / total_credits, 2) if total_credits > 0 else 0
-    student["grades"]["earned_credits"] = total_credits
+    rows = []
+    touched = {}
+    for grade in bulk.items:
+        key, student = resolve_student(grade.student_key)
+        rows.append((key, grade.subject, set_subject_grade(student, grade)))
+        touched[key] = student["grades"]
     
-    save_data(DATA)
-    return {"message": f"Grade updated for {grade.subject}"}
+    db.upsert_grade_many(rows, touched)
+    return {"message": f"Grades updated for {len(rows)} entries"}
 
 
-@app.delete("/api/admin/grade/{student_key}/{subject}")
-def delete_grade(student_key: str, subject: str):
+@admin.delete("/grade/{student_key}/{subject}")
+def delete_grade(ref: StudentRef, subject: str):
     """Delete grade for a subject"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    if subject in DATA["students"][key]["grades"]["current_semester"]:
-        del DATA["students"][key]["grades"]["current_semester"][subject]
-        save_data(DATA)
+    grades = semester_totals(student["grades"])
+    if subject in grades["current_semester"]:
+        old = grades["current_semester"].pop(subject)
+        adjust_sgpa(grades, -grade_points(old), -old["credits"])
+        db.delete_grade(key, subject, grades)
     
     return {"message": f"Grade deleted for {subject}"}
 
 
 # --- EXAMS ---
 
-@app.post("/api/admin/exam")
-def add_exam(exam: ExamUpdate):
-    """Add exam for a student"""
-    key = exam.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    DATA["students"][key]["exams"].append({
+def exam_record(exam: ExamUpdate):
+    return {
         "subject": exam.subject,
         "date": exam.date,
         "time": exam.time,
         "venue": exam.venue,
         "type": exam.exam_type,
         "days_left": exam.days_left
-    })
+    }
+
+
+@admin.post("/exam")
+def add_exam(exam: ExamUpdate):
+    """Add exam for a student"""
+    key, student = resolve_student(exam.student_key)
     
-    save_data(DATA)
+    new_exam = exam_record(exam)
+    student["exams"].append(new_exam)
+    
+    db.add_exam(key, new_exam)
     return {"message": f"Exam added for {exam.subject}"}
 
 
-@app.delete("/api/admin/exam/{student_key}/{subject}")
-def delete_exam(student_key: str, subject: str):
+@admin.post("/exam/bulk")
+def add_exam_bulk(bulk: ExamBulk):
+    """Add exams for many students in one transaction"""
+    require_students(exam.student_key for exam in bulk.items)
+    
+    entries = []
+    for exam in bulk.items:
+        key, student = resolve_student(exam.student_key)
+        new_exam = exam_record(exam)
+        student["exams"].append(new_exam)
+        entries.append((key, new_exam))
+    
+    db.add_exams(entries)
+    return {"message": f"{len(entries)} exams added"}
+
+
+@admin.delete("/exam/{student_key}/{subject}")
+def delete_exam(ref: StudentRef, subject: str):
     """Delete exam for a subject"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    DATA["students"][key]["exams"] = [e for e in DATA["students"][key]["exams"] if e["subject"] != subject]
-    save_data(DATA)
+    remove_where(student["exams"], "subject", subject)
+    db.delete_exams(key, subject)
     return {"message": f"Exam deleted for {subject}"}
 
 
 # --- FEES ---
 
-@app.post("/api/admin/fees")
+@admin.post("/fees")
 def update_fees(fee: FeeUpdate):
     """Update student fees"""
-    key = fee.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    student = DATA["students"][key]
+    key, student = resolve_student(fee.student_key)
     student["fees"]["total_fee"] = fee.total_fee
     student["fees"]["paid"] = fee.paid
     student["fees"]["pending"] = fee.total_fee - fee.paid
     student["fees"]["due_date"] = fee.due_date
     
-    save_data(DATA)
+    db.update_fees(key, student["fees"])
     return {"message": "Fees updated successfully"}
 
 
-@app.post("/api/admin/fees/payment/{student_key}")
-def add_payment(student_key: str, amount: int, mode: str = "Online"):
+@admin.post("/fees/payment/{student_key}")
+def add_payment(ref: StudentRef, amount: int, mode: str = "Online"):
     """Record a fee payment"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    student = DATA["students"][key]
+    key, student = ref
     student["fees"]["paid"] += amount
     student["fees"]["pending"] = student["fees"]["total_fee"] - student["fees"]["paid"]
-    student["fees"]["payment_history"].append({
-        "date": datetime.now().strftime("%d %b %Y"),
+    payment = {
+        "date": today_str(),
         "amount": amount,
-        "mode": mode,
-        "receipt": f"REC{len(student['fees']['payment_history'])+1:03d}"
-    })
+        "mode": mode
+    }
+    payment["receipt"] = db.add_payment(key, payment, student["fees"])
+    student["fees"]["payment_history"].append(payment)
+    records_changed()
     
-    save_data(DATA)
     return {"message": f"Payment of ₹{amount} recorded"}
 
 
 # --- LIBRARY ---
 
-@app.post("/api/admin/library/book")
+@admin.post("/library/book")
 def add_library_book(book: LibraryBookAdd):
     """Add a borrowed book for student"""
-    key = book.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    student = DATA["students"][key]
+    key, student = resolve_student(book.student_key)
     student["library"]["books_borrowed"].append({
         "title": book.title,
         "author": book.author,
@@ -529,35 +955,29 @@ def add_library_book(book: LibraryBookAdd):
     })
     student["library"]["total_borrowed"] = len(student["library"]["books_borrowed"])
     
-    save_data(DATA)
+    db.save_student(key, student)
     return {"message": f"Book '{book.title}' added"}
 
 
-@app.delete("/api/admin/library/book/{student_key}/{title}")
-def return_book(student_key: str, title: str):
+@admin.delete("/library/book/{student_key}/{title}")
+def return_book(ref: StudentRef, title: str):
     """Return a book"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
-    
-    student = DATA["students"][key]
-    student["library"]["books_borrowed"] = [b for b in student["library"]["books_borrowed"] if b["title"] != title]
+    key, student = ref
+    remove_where(student["library"]["books_borrowed"], "title", title)
     student["library"]["total_borrowed"] = len(student["library"]["books_borrowed"])
     
-    save_data(DATA)
+    db.save_student(key, student)
     return {"message": f"Book '{title}' returned"}
 
 
 # --- COURSES ---
 
-@app.post("/api/admin/course/{student_key}")
-def add_course_to_student(student_key: str, course: CourseCreate):
+@admin.post("/course/{student_key}")
+def add_course_to_student(ref: StudentRef, course: CourseCreate):
     """Add a course to student"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    DATA["students"][key]["courses"].append({
+    student["courses"].append({
         "code": course.code,
         "name": course.name,
         "credits": course.credits,
@@ -565,59 +985,64 @@ def add_course_to_student(student_key: str, course: CourseCreate):
         "schedule": course.schedule
     })
     
-    save_data(DATA)
+    db.save_student(key, student)
     return {"message": f"Course {course.name} added"}
 
 
-@app.delete("/api/admin/course/{student_key}/{course_code}")
-def remove_course(student_key: str, course_code: str):
+@admin.delete("/course/{student_key}/{course_code}")
+def remove_course(ref: StudentRef, course_code: str):
     """Remove a course from student"""
-    key = student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = ref
     
-    DATA["students"][key]["courses"] = [c for c in DATA["students"][key]["courses"] if c["code"] != course_code]
-    save_data(DATA)
+    remove_where(student["courses"], "code", course_code)
+    db.save_student(key, student)
     return {"message": f"Course {course_code} removed"}
 
 
 # --- NOTICES ---
 
-@app.get("/api/admin/notices")
-def get_notices():
-    """Get all notices"""
-    return {"notices": DATA["notices"]}
+@admin.get("/notices")
+async def get_notices() -> Dict[str, Any]:
+    """Get all notices (newest first)"""
+    return {"notices": list(reversed(DATA["notices"].values()))}
+
+
+@admin.get("/notices/search")
+def search_notices(q: str):
+    """Full-text search over notices"""
+    return {"notices": db.search_notices(q)}
 
 
-@app.post("/api/admin/notice")
+@admin.post("/notice")
 def create_notice(notice: NoticeCreate):
     """Create a new notice"""
     new_notice = {
-        "id": len(DATA["notices"]) + 1,
+        "id": None,
         "title": notice.title,
         "content": notice.content,
         "type": notice.notice_type,
-        "date": datetime.now().strftime("%d %b %Y"),
+        "date": today_str(),
         "author": notice.author,
         "time_ago": "Just now"
     }
-    DATA["notices"].insert(0, new_notice)
-    save_data(DATA)
+    new_notice["id"] = db.add_notice(new_notice)
+    DATA["notices"][new_notice["id"]] = new_notice
+    records_changed()
     return {"message": "Notice created", "notice": new_notice}
 
 
-@app.delete("/api/admin/notice/{notice_id}")
+@admin.delete("/notice/{notice_id}")
 def delete_notice(notice_id: int):
     """Delete a notice"""
-    DATA["notices"] = [n for n in DATA["notices"] if n["id"] != notice_id]
-    save_data(DATA)
+    DATA["notices"].pop(notice_id, None)
+    db.delete_notice(notice_id)
     return {"message": "Notice deleted"}
 
 
 # --- TIMETABLE ---
 
-@app.get("/api/admin/timetable")
-def get_timetable():
+@admin.get("/timetable")
+async def get_timetable() -> Dict[str, Any]:
     """Get full timetable"""
     return {"timetable": DATA["timetable"]}
 
@@ -626,39 +1051,38 @@ def get_timetable():
 # CAFETERIA ADMIN
 # =============================================
 
-@app.get("/api/admin/cafeteria/orders")
-def get_all_orders():
-    """Get all orders from all students"""
-    all_orders = []
-    for key, student in DATA["students"].items():
-        if "cafeteria_orders" in student:
-            for order in student["cafeteria_orders"]:
-                order_with_user = order.copy()
-                order_with_user["student_name"] = student["name"]
-                order_with_user["student_key"] = key
-                all_orders.append(order_with_user)
+@admin.get("/cafeteria/orders")
+def get_all_orders(status: Optional[str] = None):
+    """Get all orders from all students (newest first)"""
+    def encode():
+        yield b'{"orders":['
+        first = True
+        for batch in db.iter_orders(status):
+            if not first:
+                yield b","
+            yield b",".join(orjson.dumps(order) for order in batch)
+            first = False
+        yield b"]}"
     
-    # Sort by date/time (newest first) - simplified
-    return {"orders": all_orders}
+    return StreamingResponse(encode(), media_type="application/json")
 
-@app.post("/api/admin/cafeteria/order/status")
+@admin.post("/cafeteria/order/status")
 def update_order_status(update: OrderStatusUpdate):
     """Update order status"""
-    key = update.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = resolve_student(update.student_key)
+    
+    if not db.update_order_status(key, update.order_id, update.status):
+        raise HTTPException(status_code=404, detail="Order not found")
     
-    student = DATA["students"][key]
-    if "cafeteria_orders" in student:
-        for order in student["cafeteria_orders"]:
-            if order["id"] == update.order_id:
-                order["status"] = update.status
-                save_data(DATA)
-                return {"message": "Order status updated"}
-                
-    raise HTTPException(status_code=404, detail="Order not found")
-
-@app.post("/api/admin/cafeteria/menu")
+    # Keep the in-memory copy served to the student in sync
+    for order in student.get("cafeteria_orders", []):
+        if order["id"] == update.order_id:
+            order["status"] = update.status
+            break
+    records_changed()
+    return {"message": "Order status updated"}
+
+@admin.post("/cafeteria/menu")
 def add_menu_item(item: MenuAdd):
     """Add a new item to menu"""
     if "cafeteria" not in DATA:
@@ -672,19 +1096,19 @@ def add_menu_item(item: MenuAdd):
         "category": item.category
     }
     DATA["cafeteria"]["menu"].append(new_item)
-    save_data(DATA)
+    mark_dirty()
     return {"message": "Menu item added", "item": new_item}
 
-@app.delete("/api/admin/cafeteria/menu/{item_id}")
+@admin.delete("/cafeteria/menu/{item_id}")
 def delete_menu_item(item_id: int):
     """Delete a menu item"""
     if "cafeteria" in DATA and "menu" in DATA["cafeteria"]:
-        DATA["cafeteria"]["menu"] = [i for i in DATA["cafeteria"]["menu"] if i["id"] != item_id]
-        save_data(DATA)
+        if remove_where(DATA["cafeteria"]["menu"], "id", item_id):
+            mark_dirty()
     return {"message": "Menu item deleted"}
 
 
-@app.post("/api/admin/timetable/{day}")
+@admin.post("/timetable/{day}")
 def add_class(day: str, time: str, course: str, room: str, professor: str, class_type: str = "Lecture"):
     """Add a class to timetable"""
     day = day.lower()
@@ -699,42 +1123,53 @@ def add_class(day: str, time: str, course: str, room: str, professor: str, class
         "type": class_type
     })
     
-    save_data(DATA)
+    mark_dirty()
     return {"message": f"Class added to {day}"}
 
 
+# --- VOICE STATS ---
+
+@admin.get("/intent-stats")
+async def get_intent_stats() -> Dict[str, Any]:
+    """How often each intent was answered (needs EDUCONNECT_INTENT_STATS=1)"""
+    with _intent_hits_lock:
+        hits = dict(INTENT_HITS.most_common())
+    return {"enabled": INTENT_STATS, "hits": hits}
+
+
+app.include_router(admin)
+
+
 # =============================================
 # NEW FEATURE ENDPOINTS
 # =============================================
 
 @app.get("/api/placements")
-def get_placements():
+async def get_placements() -> Dict[str, Any]:
     return {"placements": DATA.get("placements", [])}
 
 @app.get("/api/events")
-def get_events():
+async def get_events() -> Dict[str, Any]:
     return {"events": DATA.get("events", [])}
 
 @app.get("/api/faculty")
-def get_faculty():
+async def get_faculty() -> Dict[str, Any]:
     return {"faculty": DATA.get("faculty", [])}
 
 @app.get("/api/cafeteria")
-def get_cafeteria():
+async def get_cafeteria() -> Dict[str, Any]:
     return {"menu": DATA.get("cafeteria", {}).get("menu", [])}
 
 @app.get("/api/orders")
-def get_my_orders(student_key: str = "lakshya sharma"):
-    key = student_key.lower()
-    if key in DATA["students"]:
+async def get_my_orders(student_key: str = "lakshya sharma") -> Dict[str, Any]:
+    key = find_student_key(student_key)
+    if key is not None:
         return {"orders": DATA["students"][key].get("cafeteria_orders", [])}
     return {"orders": []}
 
 @app.post("/api/appointment")
 def book_appointment(appt: AppointmentBook):
-    key = appt.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = resolve_student(appt.student_key)
     
     # In a real app, we would check professor availability here
     new_appt = {
@@ -745,34 +1180,32 @@ def book_appointment(appt: AppointmentBook):
         "status": "Pending Approval"
     }
     
-    student = DATA["students"][key]
     if "faculty_appointments" not in student:
         student["faculty_appointments"] = []
     
     student["faculty_appointments"].append(new_appt)
-    save_data(DATA)
+    db.save_student(key, student)
     return {"message": "Appointment request sent", "appointment": new_appt}
 
 @app.post("/api/order")
 def place_order(order: CafeteriaOrder):
-    key = order.student_key.lower()
-    if key not in DATA["students"]:
-        raise HTTPException(status_code=404, detail="Student not found")
+    key, student = resolve_student(order.student_key)
     
     new_order = {
-        "id": f"ORD{datetime.now().strftime('%M%S')}",
+        "id": None,
         "items": order.items,
         "total": order.total_amount,
         "status": "Preparing",
-        "date": datetime.now().strftime("%d %b %Y")
+        "date": today_str()
     }
+    # Commit first: a failed insert must not leave the order in memory
+    new_order["id"] = db.add_order(key, new_order)
     
-    student = DATA["students"][key]
     if "cafeteria_orders" not in student:
         student["cafeteria_orders"] = []
         
     student["cafeteria_orders"].insert(0, new_order)
-    save_data(DATA)
+    records_changed()
     return {"message": "Order placed successfully", "order": new_order}
 
 
@@ -780,269 +1213,418 @@ def place_order(order: CafeteriaOrder):
 # STUDENT VOICE API (Original)
 # =============================================
 
-def detect_intent(text: str):
-    """Detect user intent from the query text."""
-    t = text.lower()
-    
-    if any(word in t for word in ["attendance", "present", "absent"]):
-        return "attendance"
-    if any(word in t for word in ["timetable", "schedule", "class today", "classes today", "today's class"]):
-        return "timetable"
-    if any(word in t for word in ["exam", "test", "examination", "mid-sem", "end-sem"]):
-        return "exams"
-    if any(word in t for word in ["grade", "result", "marks", "cgpa", "sgpa", "gpa", "score"]):
-        return "grades"
-    if any(word in t for word in ["library", "book", "borrow", "due", "fine"]):
-        return "library"
-    if any(word in t for word in ["fee", "payment", "pay", "dues", "tuition"]):
-        return "fees"
-    if any(word in t for word in ["notice", "announcement", "news", "update", "circular"]):
-        return "notices"
-    if any(word in t for word in ["course", "subject", "credit", "professor", "teacher"]):
-        return "courses"
-    if any(word in t for word in ["profile", "my info", "my details", "about me", "student info"]):
-        return "profile"
-    if any(word in t for word in ["help", "what can you", "how to", "assist"]):
-        return "help"
-    if any(word in t for word in ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]):
-        return "greet"
-    
+# Keywords per intent, in priority order: when a query mentions several
+# intents the earliest one wins. Keywords match whole words (or runs of
+# words), so inflections are listed explicitly. The order is a tie-break,
+# not a speed knob (all keywords are found in one pass): check traffic
+# with EDUCONNECT_INTENT_STATS before moving an intent.
+INTENT_KEYWORDS = [
+    ("attendance", frozenset({"attendance", "present", "absent"})),
+    ("timetable", frozenset({"timetable", "timetables", "schedule", "schedules",
+                             "class today", "classes today", "today's class", "today's classes"})),
+    ("exams", frozenset({"exam", "exams", "test", "tests", "examination", "examinations",
+                         "mid-sem", "end-sem"})),
+    ("grades", frozenset({"grade", "grades", "result", "results", "marks", "cgpa", "sgpa", "gpa",
+                          "score", "scores"})),
+    ("library", frozenset({"library", "book", "books", "borrow", "borrowed", "due", "fine", "fines"})),
+    ("fees", frozenset({"fee", "fees", "payment", "payments", "pay", "dues", "tuition"})),
+    ("notices", frozenset({"notice", "notices", "announcement", "announcements", "news",
+                           "update", "updates", "circular", "circulars"})),
+    ("courses", frozenset({"course", "courses", "subject", "subjects", "credit", "credits",
+                           "professor", "professors", "teacher", "teachers"})),
+    ("profile", frozenset({"profile", "my info", "my details", "about me", "student info"})),
+    ("help", frozenset({"help", "what can you", "how to", "assist"})),
+    ("greet", frozenset({"hello", "hi", "hey", "good morning", "good afternoon", "good evening"})),
     # New Intents
-    if any(word in t for word in ["placement", "job", "internship", "recruit", "company", "package", "ctc"]):
-        return "placements"
-    if any(word in t for word in ["event", "club", "workshop", "fest", "seminar", "hackathon", "activity"]):
-        return "events"
-    if any(word in t for word in ["faculty", "professor", "teacher", "appointment", "cabin", "meet sir", "meet ma'am"]):
-        return "faculty"
-    if any(word in t for word in ["cafeteria", "canteen", "food", "menu", "order", "eat", "lunch", "snack"]):
-        return "cafeteria"
-    if any(word in t for word in ["predict cgpa", "calculate cgpa", "target cgpa", "gpa calculator"]):
-        return "cgpa_calc"
-    
-    return "unknown"
-
-
-def get_day_from_text(text: str):
-    """Extract day name from text."""
-    days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-    t = text.lower()
-    
-    if "today" in t:
-        return datetime.now().strftime("%A").lower()
-    if "tomorrow" in t:
-        day_index = datetime.now().weekday()
-        return days[(day_index + 1) % 7]
-    
-    for day in days:
-        if day in t:
+    ("placements", frozenset({"placement", "placements", "job", "jobs", "internship", "internships",
+                              "recruit", "recruitment", "recruiters", "company", "companies",
+                              "package", "packages", "ctc"})),
+    ("events", frozenset({"event", "events", "club", "clubs", "workshop", "workshops", "fest", "fests",
+                          "seminar", "seminars", "hackathon", "hackathons", "activity", "activities"})),
+    ("faculty", frozenset({"faculty", "professor", "professors", "teacher", "teachers",
+                           "appointment", "appointments", "cabin", "meet sir", "meet ma'am"})),
+    ("cafeteria", frozenset({"cafeteria", "canteen", "food", "menu", "order", "orders", "eat",
+                             "lunch", "snack", "snacks"})),
+    ("cgpa_calc", frozenset({"predict cgpa", "calculate cgpa", "target cgpa", "gpa calculator"})),
+]
+
+# Priority of each keyword (one listed under two intents belongs to the
+# earlier)
+_KEYWORD_PRIORITY: Dict[str, int] = {}
+for _prio, (_intent, _keywords) in enumerate(INTENT_KEYWORDS):
+    for _kw in sorted(_keywords):
+        _KEYWORD_PRIORITY.setdefault(_kw, _prio)
+
+
+def _trie_pattern(words) -> str:
+    """Regex matching any of words, shaped as a trie so that each position
+    only follows one branch; where words share a prefix the longest wins"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in node.items() if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+    
+    return build(trie)
+
+
+# Every keyword in the text, found in one pass. A keyword must be a whole
+# word or run of words: words are [a-z0-9] runs that may be joined by ' or
+# - ("mid-sem", "today's"). The lookahead lets matches overlap, and the
+# longest keyword at each position is the one reported.
+_WORD_START = r"(?<![a-z0-9])(?<![a-z0-9]['-])"
+_WORD_END = r"(?![a-z0-9])(?!['-][a-z0-9])"
+_INTENT_SCAN = re.compile(_WORD_START + "(?=(" + _trie_pattern(_KEYWORD_PRIORITY) + ")" + _WORD_END + ")")
+
+# A reported keyword also stands for the shorter keywords it begins with
+# ("gpa calculator" contains "gpa"), so it carries their best priority
+_MATCH_PRIORITY = {kw: min(p for k, p in _KEYWORD_PRIORITY.items() if kw == k or kw.startswith(k + " "))
+                   for kw in _KEYWORD_PRIORITY}
+_INTENT_NAMES = [intent for intent, _ in INTENT_KEYWORDS] + ["unknown"]
+
+
+def detect_intent(text_lower: str):
+    """Detect user intent from the lowercased query text."""
+    best = len(INTENT_KEYWORDS)
+    for keyword in _INTENT_SCAN.findall(text_lower):
+        prio = _MATCH_PRIORITY[keyword]
+        if prio < best:
+            best = prio
+    
+    return _INTENT_NAMES[best]
+
+
+# Indexed by datetime.weekday(), so no locale-dependent strftime("%A")
+_DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+# Day names and their plurals ("mondays") -> day name
+_DAY_LOOKUP = {**{day: day for day in _DAYS}, **{day + "s": day for day in _DAYS}}
+# Letters only, so "tomorrow's" still yields "tomorrow"
+_DAY_WORD_RE = re.compile(r"[a-z]+")
+
+
+def get_day_from_text(text_lower: str, now: Optional[datetime] = None):
+    """Extract day name from the lowercased query text."""
+    now = now or datetime.now()
+    words = _DAY_WORD_RE.findall(text_lower)
+    
+    if "today" in words:
+        return _DAYS[now.weekday()]
+    if "tomorrow" in words:
+        return _DAYS[(now.weekday() + 1) % 7]
+    
+    for word in words:
+        day = _DAY_LOOKUP.get(word)
+        if day:
             return day
     
-    return datetime.now().strftime("%A").lower()
+    return _DAYS[now.weekday()]
+
+
+# --- INTENT HANDLERS ---
+# Each takes the student record, the normalized query text and the time
+
+# Replies that are the same for everyone, built once
+_HELP_REPLY = ("🤖 I can help you with:\n\n"
+               "📊 Attendance | 📅 Timetable | 📝 Exams\n"
+               "🎓 Grades | 📚 Library | 💰 Fees\n"
+               "📢 Notices | 📖 Courses | 👤 Profile")
+_CGPA_REPLY = ("🔢 To calculate your target CGPA, please use the 'CGPA Predictor' tool in the "
+               "dashboard menu. It allows you to simulate your future grades!")
+_UNKNOWN_REPLY = ("I didn't understand. Try asking about attendance, timetable, exams, fees, "
+                  "library, placements, events, faculty, or cafeteria!")
+
+# Marker per borrowed book status / notice type; anything else gets the default
+_STATUS_EMOJI = {"Overdue": "🔴", "Due Soon": "🟡"}
+_NOTICE_EMOJI = {"urgent": "🔴", "warning": "🟡"}
+
+def _h_attendance(student, text, now):
+    att = student["attendance"]
+    overall = att["overall_percent"]
+    present = att["present"]
+    absent = att["absent"]
+    total = att["total_classes"]
+    
+    parts = [f"📊 Your overall attendance is {overall}%.\n",
+             f"Classes attended: {present}/{total} (Absent: {absent})\n\n",
+             "Subject-wise breakdown:\n",
+             "\n".join(f"• {subj}: {data['percent']}%" for subj, data in att["subjects"].items())]
+    
+    if overall < 75:
+        parts.append("\n\n⚠️ Warning: Your attendance is below 75%. Please attend more classes!")
+    elif overall >= 90:
+        parts.append("\n\n🌟 Excellent attendance! Keep it up!")
+    
+    return {"reply": "".join(parts)}
 
 
-@app.post("/api/voice")
-def process(query: UserQuery):
-    """Process user query and return appropriate response."""
-    global DATA
-    DATA = load_data()  # Reload to get latest data
+def _h_timetable(student, text, now):
+    day = get_day_from_text(text, now)
+    timetable = DATA["timetable"]
     
-    text = query.text.lower()
-    intent = detect_intent(text)
-    user_key = query.user.lower()
+    if day not in timetable:
+        return {"reply": f"📅 No classes scheduled for {day.capitalize()}."}
     
-    student = DATA["students"].get(user_key)
-    if not student:
-        return {"reply": f"Sorry, I couldn't find data for {query.user}. Please check your credentials."}
+    parts = [f"📅 Timetable for {day.capitalize()}:\n\n"]
+    for c in timetable[day]:
+        parts.append(f"🕐 {c['time']} - {c['course']}\n"
+                     f"   📍 {c['room']} | 👨‍🏫 {c['professor']} | 📚 {c['type']}\n\n")
     
-    if intent == "attendance":
-        att = student["attendance"]
-        overall = att["overall_percent"]
-        present = att["present"]
-        absent = att["absent"]
-        total = att["total_classes"]
-        
-        subjects = att["subjects"]
-        subject_details = [f"{subj}: {data['percent']}%" for subj, data in subjects.items()]
-        
-        reply = f"📊 Your overall attendance is {overall}%.\n"
-        reply += f"Classes attended: {present}/{total} (Absent: {absent})\n\n"
-        reply += "Subject-wise breakdown:\n" + "\n".join(f"• {s}" for s in subject_details)
-        
-        if overall < 75:
-            reply += "\n\n⚠️ Warning: Your attendance is below 75%. Please attend more classes!"
-        elif overall >= 90:
-            reply += "\n\n🌟 Excellent attendance! Keep it up!"
-        
-        return {"reply": reply}
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_exams(student, text, now):
+    exams = student["exams"]
+    if not exams:
+        return {"reply": "📝 No upcoming exams scheduled."}
     
-    if intent == "timetable":
-        day = get_day_from_text(text)
-        timetable = DATA["timetable"]
-        
-        if day not in timetable:
-            return {"reply": f"📅 No classes scheduled for {day.capitalize()}."}
-        
-        classes = timetable[day]
-        reply = f"📅 Timetable for {day.capitalize()}:\n\n"
-        
-        for c in classes:
-            reply += f"🕐 {c['time']} - {c['course']}\n"
-            reply += f"   📍 {c['room']} | 👨‍🏫 {c['professor']} | 📚 {c['type']}\n\n"
-        
-        return {"reply": reply.strip()}
+    parts = ["📝 Upcoming Examinations:\n\n"]
+    for exam in exams:
+        parts.append(f"📌 {exam['subject']} ({exam['type']})\n"
+                     f"   📅 {exam['date']} at {exam['time']}\n"
+                     f"   📍 Venue: {exam['venue']}\n"
+                     f"   ⏳ {exam['days_left']} days left\n\n")
     
-    if intent == "exams":
-        exams = student["exams"]
-        if not exams:
-            return {"reply": "📝 No upcoming exams scheduled."}
-        
-        reply = "📝 Upcoming Examinations:\n\n"
-        for exam in exams:
-            reply += f"📌 {exam['subject']} ({exam['type']})\n"
-            reply += f"   📅 {exam['date']} at {exam['time']}\n"
-            reply += f"   📍 Venue: {exam['venue']}\n"
-            reply += f"   ⏳ {exam['days_left']} days left\n\n"
-        
-        return {"reply": reply.strip()}
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_grades(student, text, now):
+    grades = student["grades"]
     
-    if intent == "grades":
-        grades = student["grades"]
-        current = grades["current_semester"]
-        
-        reply = f"🎓 Academic Performance:\n\n"
-        reply += f"📊 CGPA: {grades['cgpa']} | SGPA: {grades['sgpa']}\n"
-        reply += f"📚 Credits: {grades['earned_credits']}/{grades['total_credits']}\n\n"
-        reply += "Current Semester Grades:\n"
-        
-        for subject, data in current.items():
-            reply += f"• {subject}: {data['grade']} ({data['marks']} marks)\n"
-        
-        return {"reply": reply.strip()}
+    parts = ["🎓 Academic Performance:\n\n",
+             f"📊 CGPA: {grades['cgpa']} | SGPA: {grades['sgpa']}\n",
+             f"📚 Credits: {grades['earned_credits']}/{grades['total_credits']}\n\n",
+             "Current Semester Grades:\n"]
+    for subject, data in grades["current_semester"].items():
+        parts.append(f"• {subject}: {data['grade']} ({data['marks']} marks)\n")
     
-    if intent == "library":
-        library = student["library"]
-        books = library["books_borrowed"]
-        
-        reply = f"📚 Library Status:\n\n"
-        reply += f"Books borrowed: {library['total_borrowed']}/{library['max_books']}\n"
-        
-        if library["total_fine"] > 0:
-            reply += f"⚠️ Outstanding fine: ₹{library['total_fine']}\n"
-        
-        reply += "\nBorrowed Books:\n"
-        for book in books:
-            status_emoji = "🔴" if book["status"] == "Overdue" else "🟡" if book["status"] == "Due Soon" else "🟢"
-            reply += f"\n{status_emoji} {book['title']}\n"
-            reply += f"   Author: {book['author']}\n"
-            reply += f"   Due: {book['due_date']} ({book['status']})\n"
-        
-        return {"reply": reply.strip()}
-    
-    if intent == "fees":
-        fees = student["fees"]
-        reply = f"💰 Fee Details:\n\n"
-        reply += f"Total Fee: ₹{fees['total_fee']:,}\n"
-        reply += f"✅ Paid: ₹{fees['paid']:,}\n"
-        reply += f"⏳ Pending: ₹{fees['pending']:,}\n"
-        reply += f"📅 Due Date: {fees['due_date']}\n"
-        
-        return {"reply": reply.strip()}
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_library(student, text, now):
+    library = student["library"]
     
-    if intent == "notices":
-        notices = DATA["notices"]
-        reply = "📢 Latest Notices:\n\n"
-        
-        for notice in notices[:5]:
-            type_emoji = "🔴" if notice["type"] == "urgent" else "🟡" if notice["type"] == "warning" else "🔵"
-            reply += f"{type_emoji} {notice['title']}\n"
-            reply += f"   📍 {notice['author']} • {notice['time_ago']}\n\n"
-        
-        return {"reply": reply.strip()}
+    parts = ["📚 Library Status:\n\n",
+             f"Books borrowed: {library['total_borrowed']}/{library['max_books']}\n"]
+    if library["total_fine"] > 0:
+        parts.append(f"⚠️ Outstanding fine: ₹{library['total_fine']}\n")
     
-    if intent == "courses":
-        courses = student["courses"]
-        reply = "📖 Enrolled Courses:\n\n"
-        
-        for course in courses:
-            reply += f"📚 {course['code']}: {course['name']}\n"
-            reply += f"   👨‍🏫 {course['professor']} | 📊 {course['credits']} credits\n\n"
-        
-        return {"reply": reply.strip()}
-    
-    if intent == "profile":
-        reply = f"👤 Student Profile:\n\n"
-        reply += f"📛 Name: {student['name']}\n"
-        reply += f"🆔 Roll No: {student['roll_no']}\n"
-        reply += f"📧 Email: {student['email']}\n"
-        reply += f"📱 Phone: {student['phone']}\n"
-        reply += f"🎓 Course: {student['course']}\n"
-        reply += f"📅 Year: {student['year']} ({student['semester']})\n"
-        reply += f"📊 CGPA: {student['cgpa']}"
-        
-        return {"reply": reply}
+    parts.append("\nBorrowed Books:\n")
+    for book in library["books_borrowed"]:
+        status_emoji = _STATUS_EMOJI.get(book["status"], "🟢")
+        parts.append(f"\n{status_emoji} {book['title']}\n"
+                     f"   Author: {book['author']}\n"
+                     f"   Due: {book['due_date']} ({book['status']})\n")
     
-    if intent == "help":
-        reply = "🤖 I can help you with:\n\n"
-        reply += "📊 Attendance | 📅 Timetable | 📝 Exams\n"
-        reply += "🎓 Grades | 📚 Library | 💰 Fees\n"
-        reply += "📢 Notices | 📖 Courses | 👤 Profile"
-        
-        return {"reply": reply}
-    
-    if intent == "greet":
-        hour = datetime.now().hour
-        greeting = "Good morning" if hour < 12 else "Good afternoon" if hour < 17 else "Good evening"
-        return {"reply": f"{greeting}, {student['name']}! 👋 How can I help you today?"}
-
-    # --- NEW FEATURE HANDLERS ---
-
-    if intent == "placements":
-        placements = DATA.get("placements", [])
-        reply = "💼 Placement Updates:\n\n"
-        for p in placements:
-            reply += f"🏢 {p['company']} ({p['type']})\n"
-            reply += f"   💰 CTC: {p['ctc']} | Role: {p['roles'][0]}\n"
-            reply += f"   📅 Date: {p['date']}\n\n"
-        return {"reply": reply.strip()}
-
-    if intent == "events":
-        events = DATA.get("events", [])
-        reply = "🎭 Upcoming Campus Events:\n\n"
-        for e in events:
-            reply += f"🎪 {e['name']}\n"
-            reply += f"   📅 {e['date']} @ {e['venue']}\n"
-            reply += f"   ℹ️ {e['description']}\n\n"
-        return {"reply": reply.strip()}
-
-    if intent == "faculty":
-        faculty = DATA.get("faculty", [])
-        reply = "👨‍🏫 Faculty Directory:\n\n"
-        for f in faculty:
-            reply += f"👤 {f['name']} ({f['designation']})\n"
-            reply += f"   📍 {f['cabin']} | 📧 {f['email']}\n\n"
-        
-        reply += "You can ask me to 'Book an appointment' if needed!"
-        return {"reply": reply.strip()}
-
-    if intent == "cafeteria":
-        menu = DATA.get("cafeteria", {}).get("menu", [])
-        reply = "🍔 Cafeteria Menu:\n\n"
-        for item in menu:
-            reply += f"• {item['item']} - ₹{item['price']}\n"
-        
-        reply += "\nSay 'Order [Item Name]' to place an order!"
-        return {"reply": reply.strip()}
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_fees(student, text, now):
+    fees = student["fees"]
+    return {"reply": (f"💰 Fee Details:\n\n"
+                      f"Total Fee: ₹{fees['total_fee']:,}\n"
+                      f"✅ Paid: ₹{fees['paid']:,}\n"
+                      f"⏳ Pending: ₹{fees['pending']:,}\n"
+                      f"📅 Due Date: {fees['due_date']}")}
+
+
+def _h_notices(student, text, now):
+    parts = ["📢 Latest Notices:\n\n"]
+    for notice in islice(reversed(DATA["notices"].values()), 5):
+        type_emoji = _NOTICE_EMOJI.get(notice["type"], "🔵")
+        parts.append(f"{type_emoji} {notice['title']}\n"
+                     f"   📍 {notice['author']} • {notice['time_ago']}\n\n")
+    
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_courses(student, text, now):
+    parts = ["📖 Enrolled Courses:\n\n"]
+    for course in student["courses"]:
+        parts.append(f"📚 {course['code']}: {course['name']}\n"
+                     f"   👨‍🏫 {course['professor']} | 📊 {course['credits']} credits\n\n")
+    
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_profile(student, text, now):
+    return {"reply": (f"👤 Student Profile:\n\n"
+                      f"📛 Name: {student['name']}\n"
+                      f"🆔 Roll No: {student['roll_no']}\n"
+                      f"📧 Email: {student['email']}\n"
+                      f"📱 Phone: {student['phone']}\n"
+                      f"🎓 Course: {student['course']}\n"
+                      f"📅 Year: {student['year']} ({student['semester']})\n"
+                      f"📊 CGPA: {student['cgpa']}")}
+
+
+def _h_help(student, text, now):
+    return {"reply": _HELP_REPLY}
+
+
+def _h_greet(student, text, now):
+    hour = now.hour
+    greeting = "Good morning" if hour < 12 else "Good afternoon" if hour < 17 else "Good evening"
+    return {"reply": f"{greeting}, {student['name']}! 👋 How can I help you today?"}
+
+
+# --- NEW FEATURE HANDLERS ---
 
-    if intent == "cgpa_calc":
-        return {"reply": "🔢 To calculate your target CGPA, please use the 'CGPA Predictor' tool in the dashboard menu. It allows you to simulate your future grades!"}
+def _h_placements(student, text, now):
+    parts = ["💼 Placement Updates:\n\n"]
+    for p in DATA.get("placements", []):
+        parts.append(f"🏢 {p['company']} ({p['type']})\n"
+                     f"   💰 CTC: {p['ctc']} | Role: {p['roles'][0]}\n"
+                     f"   📅 Date: {p['date']}\n\n")
+    return {"reply": "".join(parts).strip()}
 
-    return {"reply": "I didn't understand. Try asking about attendance, timetable, exams, fees, library, placements, events, faculty, or cafeteria!"}
+
+def _h_events(student, text, now):
+    parts = ["🎭 Upcoming Campus Events:\n\n"]
+    for e in DATA.get("events", []):
+        parts.append(f"🎪 {e['name']}\n"
+                     f"   📅 {e['date']} @ {e['venue']}\n"
+                     f"   ℹ️ {e['description']}\n\n")
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_faculty(student, text, now):
+    parts = ["👨‍🏫 Faculty Directory:\n\n"]
+    for f in DATA.get("faculty", []):
+        parts.append(f"👤 {f['name']} ({f['designation']})\n"
+                     f"   📍 {f['cabin']} | 📧 {f['email']}\n\n")
+    
+    parts.append("You can ask me to 'Book an appointment' if needed!")
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_cafeteria(student, text, now):
+    parts = ["🍔 Cafeteria Menu:\n\n"]
+    for item in DATA.get("cafeteria", {}).get("menu", []):
+        parts.append(f"• {item['item']} - ₹{item['price']}\n")
+    
+    parts.append("\nSay 'Order [Item Name]' to place an order!")
+    return {"reply": "".join(parts).strip()}
+
+
+def _h_cgpa_calc(student, text, now):
+    return {"reply": _CGPA_REPLY}
+
+
+def _h_unknown(student, text, now):
+    return {"reply": _UNKNOWN_REPLY}
+
+
+HANDLERS = {
+    "attendance": _h_attendance,
+    "timetable": _h_timetable,
+    "exams": _h_exams,
+    "grades": _h_grades,
+    "library": _h_library,
+    "fees": _h_fees,
+    "notices": _h_notices,
+    "courses": _h_courses,
+    "profile": _h_profile,
+    "help": _h_help,
+    "greet": _h_greet,
+    "placements": _h_placements,
+    "events": _h_events,
+    "faculty": _h_faculty,
+    "cafeteria": _h_cafeteria,
+    "cgpa_calc": _h_cgpa_calc,
+}
+
+# Intents whose reply depends only on stored data, not on the query text or
+# the clock: True if it is per student, False if it is the same for everyone
+RENDER_ONCE = {
+    "attendance": True, "exams": True, "grades": True, "library": True,
+    "fees": True, "courses": True, "profile": True,
+    "notices": False, "placements": False, "events": False, "faculty": False, "cafeteria": False,
+}
+
+# Encoded RENDER_ONCE replies by (intent, student key or None), valid for
+# _rendered_version only
+_rendered: Dict[Tuple[str, Optional[str]], bytes] = {}
+_rendered_version = None
+_render_lock = threading.Lock()
+
+def rendered_reply(intent: str, user_key: Optional[str], version) -> bytes:
+    """Reply for a RENDER_ONCE intent, built once per data version"""
+    global _rendered_version
+    with _render_lock:
+        if version != _rendered_version:
+            _rendered.clear()
+            _rendered_version = version
+        body = _rendered.get((intent, user_key))
+        if body is None:
+            student = DATA["students"][user_key] if user_key else None
+            body = _rendered[intent, user_key] = orjson.dumps(HANDLERS[intent](student, "", None))
+        return body
+
+
+# Intent frequencies, counted per request when enabled (cached replies
+# included); see GET /api/admin/intent-stats
+INTENT_STATS = os.environ.get("EDUCONNECT_INTENT_STATS") == "1"
+INTENT_HITS: Counter = Counter()
+# Requests run in the threadpool, and Counter += is not atomic
+_intent_hits_lock = threading.Lock()
+
+
+def data_version():
+    """Changes whenever anything a voice reply is built from does"""
+    return db.data_version(), _records_edits, _catalog_version
+
+
+@app.post("/api/voice")
+def process(query: UserQuery):
+    """Process user query and return appropriate response."""
+    reload_records()  # Reload to get latest data
+    
+    user_key = find_student_key(query.user)
+    if not DATA["students"].get(user_key):
+        return {"reply": f"Sorry, I couldn't find data for {query.user}. Please check your credentials."}
+    
+    # Replies also depend on the clock (greeting, today's timetable), but
+    # never on anything finer than the hour
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    text = " ".join(query.text.lower().split())
+    intent, body = voice_reply(user_key, text, data_version(), now)
+    if INTENT_STATS:
+        with _intent_hits_lock:
+            INTENT_HITS[intent] += 1
+    return Response(body, media_type="application/json")
+
+
+@lru_cache(maxsize=128)
+def voice_reply(user_key: str, text: str, version, now: datetime) -> Tuple[str, bytes]:
+    """Intent and encoded reply for a normalized query. Cached: every
+    argument is part of the key, so a data edit or a new hour makes fresh
+    replies."""
+    intent = detect_intent(text)
+    if intent in RENDER_ONCE:
+        return intent, rendered_reply(intent, user_key if RENDER_ONCE[intent] else None, version)
+    return intent, orjson.dumps(HANDLERS.get(intent, _h_unknown)(DATA["students"][user_key], text, now))
 
 
 # Duplicate root endpoint removed to allow frontend serving
 
 
 
+# Encoded health body, rebuilt at most once per HEALTH_TTL seconds
+HEALTH_TTL = 1.0
+_health = (float("-inf"), b"")
+
 @app.get("/api/health")
-def health():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+async def health():
+    global _health
+    now = time.monotonic()
+    if now - _health[0] > HEALTH_TTL:
+        _health = (now, orjson.dumps({"status": "healthy", "timestamp": datetime.now().isoformat()}))
+    return Response(_health[1], media_type="application/json")